@@ -1,9 +1,14 @@
 """
 Bill splitting calculation module.
 Handles consumption calculation, cover payments, and settlement optimization.
+
+Dish, cover and payment inputs are read by key only, so plain dicts and the
+API's request records can be passed in interchangeably.
 """
 
 import heapq
+import math
+from fractions import Fraction
 from typing import List, Dict, Tuple
 
 
@@ -19,6 +24,7 @@ def calculate_consumption(
     - Empty people list
     - Empty dishes list
     - Negative prices (treated as 0)
+    - Non-finite or overflowing prices (treated as 0)
     - Dish with no one eating it (skipped)
     - Negative or zero ratios (ignored)
     
@@ -34,41 +40,76 @@ def calculate_consumption(
     if not people_ids:
         return {}, 0.0
     
-    raw_consumption = {pid: 0.0 for pid in people_ids}
-    total_bill_price = 0.0
-
     # Edge case: no dishes
     if not dishes:
-        return raw_consumption, 0.0
+        return dict.fromkeys(people_ids, 0.0), 0.0
+
+    # Invert ratios into dish_id -> [(person_id, ratio), ...] once, so each
+    # dish only iterates the flat list of people actually eating it
+    # Edge case: only positive ratios are valid
+    # Total units per dish are accumulated in the same pass
+    by_dish: Dict[str, List[Tuple[str, int]]] = {}
+    units_by_dish: Dict[str, int] = {}
+    for pid in people_ids:
+        for dish_id, r in ratios.get(pid, {}).items():
+            if r > 0:
+                by_dish.setdefault(dish_id, []).append((pid, r))
+                units_by_dish[dish_id] = units_by_dish.get(dish_id, 0) + r
+
+    # Keep each person's exact share (in cents) across the whole bill and
+    # round once at the end, so per-dish rounding can't pile up on anyone
+    exact_cents = dict.fromkeys(people_ids, Fraction(0))
+    eaten_cents = 0
+    total_cents = 0
 
     for dish in dishes:
-        # Edge case: negative or zero price
-        if dish['price'] <= 0:
+        # Edge case: negative, zero or non-finite price (NaN fails the
+        # comparison, and so does a price too large to express in cents)
+        price_cents = dish['price'] * 100
+        if not 0 < price_cents < math.inf:
             continue
-            
-        total_bill_price += dish['price']
-        
-        # Get ratios for this dish
-        dish_ratios = {}
-        total_units = 0
-        for pid in people_ids:
-            # Safely get ratio (default to 0)
-            r = 0
-            if pid in ratios and dish['id'] in ratios[pid]:
-                r = ratios[pid][dish['id']]
-            # Edge case: only positive ratios are valid
-            if r > 0:
-                dish_ratios[pid] = r
-                total_units += r
-        
+
+        price_cents = round(price_cents)
+        total_cents += price_cents
+
         # Distribute price proportionally
         # Edge case: no one eating this dish (skip distribution)
-        if total_units > 0:
-            unit_price = dish['price'] / total_units
-            for pid, r in dish_ratios.items():
-                raw_consumption[pid] += r * unit_price
+        dish_id = dish['id']
+        entries = by_dish.get(dish_id)
+        if entries:
+            units = units_by_dish[dish_id]
+            for pid, r in entries:
+                exact_cents[pid] += Fraction(price_cents * r, units)
+            eaten_cents += price_cents
 
-    return raw_consumption, total_bill_price
+    raw_cents = _round_cents(exact_cents, eaten_cents)
+    raw_consumption = {pid: cents / 100 for pid, cents in raw_cents.items()}
+    return raw_consumption, total_cents / 100
+
+
+def _round_cents(
+    exact_cents: Dict[str, Fraction],
+    amount_cents: int
+) -> Dict[str, int]:
+    """
+    Round exact per-person cent amounts to whole cents (largest remainder
+    method). Each amount is floored, then leftover cents go to the largest
+    remainders, ties resolved in people order, so the result sums exactly to
+    amount_cents; this must equal the sum of the exact amounts.
+    """
+    cents = {}
+    remainders = []
+    for pid, exact in exact_cents.items():
+        share = math.floor(exact)
+        cents[pid] = share
+        remainders.append((exact - share, pid))
+
+    leftover = amount_cents - sum(cents.values())
+    if leftover:
+        remainders.sort(key=lambda item: item[0], reverse=True)
+        for _, pid in remainders[:leftover]:
+            cents[pid] += 1
+    return cents
 
 
 def calculate_final_costs(
@@ -82,7 +123,7 @@ def calculate_final_costs(
     
     New Logic:
     1. Covers are split equally among all people
-    2. Use priority queue to process people from lowest to highest consumption
+    2. Process people once, in order from lowest to highest consumption
     3. If cover exceeds a person's share, the excess is redistributed to remaining people
     4. This ensures fair distribution with edge case handling
     
@@ -95,90 +136,99 @@ def calculate_final_costs(
     Returns:
         Map of person_id -> final cost
     """
+    return _apply_covers(people_ids, raw_consumption, total_bill_price, covers, {})
+
+
+def compute_costs(
+    people_ids: List[str],
+    dishes: List[Dict],
+    ratios: Dict[str, Dict[str, int]],
+    covers: List[Dict]
+) -> Tuple[Dict[str, float], float]:
+    """
+    Fused consumption + cover step: equivalent to calculate_consumption
+    followed by calculate_final_costs, but final costs are written over the
+    consumption map in place instead of into a second dict.
+    
+    Args:
+        people_ids: List of person IDs
+        dishes: List of dish dictionaries with 'id' and 'price'
+        ratios: Nested dict mapping person_id -> dish_id -> ratio
+        covers: List of cover payment dicts with 'person_id' and 'amount'
+        
+    Returns:
+        Tuple of (final_cost_map, total_bill_price)
+    """
+    raw_consumption, total_bill_price = calculate_consumption(people_ids, dishes, ratios)
+    final_cost = _apply_covers(
+        people_ids, raw_consumption, total_bill_price, covers, raw_consumption
+    )
+    return final_cost, total_bill_price
+
+
+def _apply_covers(
+    people_ids: List[str],
+    raw_consumption: Dict[str, float],
+    total_bill_price: float,
+    covers: List[Dict],
+    final_cost: Dict[str, float]
+) -> Dict[str, float]:
+    """
+    Fill final_cost with each person's cost after covers and return it.
+    final_cost may be raw_consumption itself: each person's consumption is
+    read before their entry is overwritten.
+    """
     # Edge case: no people
     if not people_ids:
-        return {}
+        return final_cost
     
     # Edge case: no bill
     if total_bill_price <= 0:
-        return {pid: 0.0 for pid in people_ids}
+        for pid in people_ids:
+            final_cost[pid] = 0.0
+        return final_cost
     
-    # Calculate total cover amount
-    total_covered = sum(c['amount'] for c in covers)
+    # Calculate total cover amount and track who covered what
+    # (for adding back at the end) in a single pass over covers
+    cover_map = dict.fromkeys(people_ids, 0.0)
+    total_covered = 0.0
+    for c in covers:
+        amount = c['amount']
+        total_covered += amount
+        covered = cover_map.get(c['person_id'])
+        if covered is not None:
+            cover_map[c['person_id']] = covered + amount
     
     # Edge case: covers exceed or equal total bill
     if total_covered >= total_bill_price:
         # Everyone pays nothing except those who covered
-        final_cost = {pid: 0.0 for pid in people_ids}
-        for c in covers:
-            if c['person_id'] in final_cost:
-                final_cost[c['person_id']] += c['amount']
+        final_cost.update(cover_map)
         return final_cost
     
-    # Track who covered what (for adding back at the end)
-    cover_map = {pid: 0.0 for pid in people_ids}
-    for c in covers:
-        if c['person_id'] in cover_map:
-            cover_map[c['person_id']] += c['amount']
-    
-    # Calculate initial equal split of cover amount
-    num_people = len(people_ids)
-    cover_per_person = total_covered / num_people
-    
-    # Create priority queue: (adjusted_cost, person_id)
-    # adjusted_cost = raw consumption - equal share of cover
-    heap = []
-    for pid in people_ids:
-        # Calculate this person's share of the bill before cover discount
-        consumption_share = raw_consumption[pid]
-        # Apply equal cover discount
-        adjusted_cost = consumption_share - cover_per_person
-        heapq.heappush(heap, (adjusted_cost, pid))
-    
-    # Final costs dictionary
-    final_cost = {pid: 0.0 for pid in people_ids}
+    # Fast path: if everyone consumed at least an equal share of the cover,
+    # nothing is redistributed and each person simply gets that share off
+    cover_per_person = total_covered / len(people_ids)
+    if min(raw_consumption[pid] for pid in people_ids) >= cover_per_person:
+        for pid in people_ids:
+            final_cost[pid] = raw_consumption[pid] - cover_per_person + cover_map[pid]
+        return final_cost
     
-    # Process people from lowest cost to highest
-    remaining_people = set(people_ids)
+    # Process people from lowest to highest consumption
+    order = sorted(people_ids, key=lambda pid: raw_consumption[pid])
     remaining_cover_pool = total_covered  # Track remaining cover to redistribute
+    remaining_people = len(order)
     
-    while heap and remaining_people:
-        adjusted_cost, pid = heapq.heappop(heap)
-        
-        if pid not in remaining_people:
-            continue
-        
-        # Recalculate equal share of remaining cover among remaining people
-        if len(remaining_people) > 0:
-            equal_cover_share = remaining_cover_pool / len(remaining_people)
-        else:
-            equal_cover_share = 0
-        
-        # This person's actual consumption
+    for pid in order:
+        # Equal share of remaining cover among remaining people
+        equal_cover_share = remaining_cover_pool / remaining_people
         consumption = raw_consumption[pid]
         
-        # Cost after applying cover discount
-        cost_after_cover = consumption - equal_cover_share
-        
-        # Edge case: cover exceeds this person's consumption
-        if cost_after_cover <= 0:
-            # This person pays nothing from the bill portion
-            final_cost[pid] = 0.0
-            
-            # The excess cover is redistributed
-            excess = equal_cover_share - consumption
-            remaining_cover_pool -= (equal_cover_share - excess)
-        else:
-            # Normal case: person pays reduced amount
-            final_cost[pid] = cost_after_cover
-            remaining_cover_pool -= equal_cover_share
-        
-        # Remove this person from remaining pool
-        remaining_people.remove(pid)
-    
-    # Add back the cover amounts paid by each person
-    for pid in people_ids:
-        final_cost[pid] += cover_map[pid]
+        # Edge case: cover exceeds this person's consumption, so they pay
+        # nothing and the unused part of their share is redistributed.
+        # The cover amounts paid by each person are added back on top
+        final_cost[pid] = max(0.0, consumption - equal_cover_share) + cover_map[pid]
+        remaining_cover_pool -= min(equal_cover_share, consumption)
+        remaining_people -= 1
     
     return final_cost
 
@@ -212,23 +262,24 @@ def calculate_balances(
     if not people_ids:
         return []
     
-    paid_map = {pid: 0.0 for pid in people_ids}
+    paid_map = dict.fromkeys(people_ids, 0.0)
     
     # Process payments with edge case handling
     for p in payments:
-        if p['person_id'] in paid_map:
-            # Edge case: negative payments treated as 0
-            amount = max(0.0, p.get('amount', 0.0))
-            paid_map[p['person_id']] += amount
+        # Edge case: negative payments treated as 0, so only positive
+        # amounts are accumulated
+        amount = p.get('amount', 0.0)
+        if amount > 0:
+            paid = paid_map.get(p['person_id'])
+            if paid is not None:
+                paid_map[p['person_id']] = paid + amount
 
-    balances = []
-    for pid in people_ids:
-        net = paid_map[pid] - final_costs.get(pid, 0.0)
-        # Filter out negligible amounts (floating point errors)
-        if abs(net) > threshold:
-            balances.append({"id": pid, "amount": net})
-
-    return balances
+    # Filter out negligible amounts (floating point errors)
+    return [
+        {"id": pid, "amount": net}
+        for pid in people_ids
+        if abs(net := paid_map[pid] - final_costs.get(pid, 0.0)) > threshold
+    ]
 
 
 def calculate_settlements(
@@ -237,7 +288,9 @@ def calculate_settlements(
 ) -> List[Dict[str, any]]:
     """
     Calculate optimal settlement transactions.
-    Strategy: Each debtor pays their full debt to one creditor (1 outgoing tx per debtor).
+    Strategy: Greedy two-heap matching - the largest debtor pays the largest
+    creditor, the residual goes back on its heap. O(N log N) overall, and
+    each transfer clears at least one party (at most N - 1 transactions).
     
     Edge cases handled:
     - Empty balances list
@@ -256,47 +309,71 @@ def calculate_settlements(
     if not balances or len(balances) <= 1:
         return []
     
-    # Work with a copy to avoid modifying the original
-    balances = [{"id": b["id"], "amount": b["amount"]} for b in balances]
-    settlements = []
-    
     threshold = 0.01
-    max_iterations = 100
-    iterations = 0
 
-    while len(balances) > 1 and iterations < max_iterations:
-        iterations += 1
-        
-        # Sort: most negative first (debtor), most positive last (creditor)
-        balances.sort(key=lambda x: x["amount"])
-        
-        debtor = balances[0]
-        creditor = balances[-1]
-        
-        # Edge case: debtor should be negative, creditor positive
-        # If not, the system is unbalanced (shouldn't happen with correct input)
-        if debtor["amount"] >= -threshold or creditor["amount"] <= threshold:
-            break
-        
-        # Transfer amount is what the debtor owes
-        transfer_amount = abs(debtor["amount"])
-        
-        # Edge case: ensure transfer doesn't exceed what creditor is owed
-        transfer_amount = min(transfer_amount, creditor["amount"])
-        
+    # Struct-of-arrays view: the kernel only sees amounts and works in
+    # positions, ids are resolved when building the output
+    ids = [b["id"] for b in balances]
+    amounts = [b["amount"] for b in balances]
+
+    settlements = []
+    for d, c, transfer_amount in _settle(amounts, threshold):
+        debtor_id = ids[d]
+        creditor_id = ids[c]
         settlements.append({
-            "debtor_id": debtor["id"],
-            "debtor_name": people_names.get(debtor["id"], debtor["id"]),
-            "creditor_id": creditor["id"],
-            "creditor_name": people_names.get(creditor["id"], creditor["id"]),
+            "debtor_id": debtor_id,
+            "debtor_name": people_names.get(debtor_id, debtor_id),
+            "creditor_id": creditor_id,
+            "creditor_name": people_names.get(creditor_id, creditor_id),
             "amount": round(transfer_amount, 2)
         })
-        
-        # Apply the transfer
-        creditor["amount"] -= transfer_amount  # Reduce what creditor is owed
-        debtor["amount"] += transfer_amount    # Clear/reduce debtor's debt
-        
-        # Remove settled parties (those with balance ≈ 0)
-        balances = [b for b in balances if abs(b["amount"]) > threshold]
-
     return settlements
+
+
+def _settle(amounts: List[float], threshold: float) -> List[Tuple[int, int, float]]:
+    """
+    Greedy settlement kernel: repeatedly match the largest debt with the
+    largest credit. Works on plain amounts and positions only, keeping the
+    numeric loop free of per-settlement dict handling.
+
+    Args:
+        amounts: Net balance per position (negative = owes, positive = owed)
+        threshold: Balances and residuals at or below this are treated as settled
+
+    Returns:
+        List of (debtor_index, creditor_index, unrounded transfer amount)
+    """
+    # Debtors as a min-heap of (amount, index): most negative first.
+    # Creditors as a max-heap stored as (-amount, index): largest credit first.
+    # Edge case: balances within the threshold are already settled
+    debtors = [(a, i) for i, a in enumerate(amounts) if a < -threshold]
+    creditors = [(-a, i) for i, a in enumerate(amounts) if a > threshold]
+    heapq.heapify(debtors)
+    heapq.heapify(creditors)
+    transfers = []
+
+    # Edge case: all positive or all negative balances leave one heap empty
+    # (unbalanced scenario), so no settlement is possible
+    # Each round clears at least one party, so this ends in <= N rounds
+    while debtors and creditors:
+        debt, debtor = debtors[0]
+        neg_credit, creditor = creditors[0]
+
+        # Transfer what the debtor owes, capped at what the creditor is owed
+        transfer_amount = min(-debt, -neg_credit)
+        transfers.append((debtor, creditor, transfer_amount))
+
+        # Update each heap top in place: replace it with its residual,
+        # or drop it once settled
+        debt += transfer_amount
+        if debt < -threshold:
+            heapq.heapreplace(debtors, (debt, debtor))
+        else:
+            heapq.heappop(debtors)
+        neg_credit += transfer_amount
+        if neg_credit < -threshold:
+            heapq.heapreplace(creditors, (neg_credit, creditor))
+        else:
+            heapq.heappop(creditors)
+
+    return transfers
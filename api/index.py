@@ -1,22 +1,43 @@
 import os
-import uuid
-import json
-from fastapi import FastAPI, Request, HTTPException
+import ssl
+import math
+import base64
+import logging
+import hashlib
+from collections import OrderedDict
+import orjson
+from fastapi import FastAPI, Request, HTTPException, Body
+from fastapi.exceptions import RequestValidationError
 from fastapi.templating import Jinja2Templates
-from fastapi.responses import HTMLResponse
-from pydantic import BaseModel
-from typing import List, Dict
+from fastapi.responses import HTMLResponse, Response
+from pydantic import BaseModel, Field, ValidationError
+from typing import Annotated, List, Dict
 import asyncpg
 import asyncio
+import redis.asyncio as redis
+from redis.asyncio.retry import Retry
+from redis.backoff import NoBackoff
 
 from .calculator import (
-    calculate_consumption,
-    calculate_final_costs,
+    compute_costs,
     calculate_balances,
     calculate_settlements
 )
 
-app = FastAPI()
+
+class ORJSONResponse(Response):
+    """JSON response rendered with orjson (FastAPI's own one is deprecated)"""
+    media_type = "application/json"
+
+    def render(self, content) -> bytes:
+        return orjson.dumps(content)
+
+
+app = FastAPI(default_response_class=ORJSONResponse)
+
+# Warnings and errors reach stderr even without logging configuration;
+# per-request detail is logged at DEBUG and is off by default
+logger = logging.getLogger(__name__)
 
 # Setup Templates
 # For Vercel: templates are in project root relative to api/
@@ -27,6 +48,8 @@ templates_dir = os.path.join(base_dir, "templates")
 if not os.path.exists(templates_dir):
     templates_dir = "templates"
 templates = Jinja2Templates(directory=templates_dir)
+# index.html has no per-request data, so render and encode it once at import
+_INDEX_BYTES = templates.get_template("index.html").render(request=None).encode("utf-8")
 
 # --- Database ---
 # Use DATABASE_URL from environment variable
@@ -44,117 +67,379 @@ if not DATABASE_URL:
 if DATABASE_URL.startswith("postgresql://"):
     DATABASE_URL = DATABASE_URL.replace("postgresql://", "postgres://", 1)
 
+# Connection traits are fixed for the process, so derive them once
+# Session pooler usually has "pooler" in hostname or port 6543
+IS_POOLER = "pooler" in DATABASE_URL.lower() or ":6543" in DATABASE_URL
+# SSL unless the host is localhost/127.0.0.1 (Supabase and most cloud DBs require it)
+NEEDS_SSL = "localhost" not in DATABASE_URL and "127.0.0.1" not in DATABASE_URL
+
+# For Supabase, ensure SSL is enabled
+# If connection string doesn't already have sslmode, use SSL for cloud DBs
+# with sslmode=require semantics (encrypted, certificate not verified).
+# The context is built once and shared by every connection; an explicit
+# sslmode in DATABASE_URL is left for asyncpg to honour
+CONNECT_KWARGS = {"dsn": DATABASE_URL}
+if NEEDS_SSL and "sslmode" not in DATABASE_URL:
+    _ssl_context = ssl.create_default_context()
+    _ssl_context.check_hostname = False
+    _ssl_context.verify_mode = ssl.CERT_NONE
+    CONNECT_KWARGS["ssl"] = _ssl_context
+
+# For session poolers, use smaller pool and shorter timeout
+# Session poolers handle connection management differently
+# Serverless instances handle one request at a time, so one connection suffices
+POOL_MAX_SIZE = 1 if IS_POOLER or os.getenv("VERCEL") else 2
+COMMAND_TIMEOUT = 5 if IS_POOLER else 10
+# Poolers (pgbouncer) break server-side prepared statements, so only
+# direct connections cache and reuse them
+STATEMENT_CACHE_SIZE = 0 if IS_POOLER else 100
+
 # Global pool for connection reuse (works in both local and serverless)
 _pool = None
-_table_created = False
+_pool_loop = None
+# Table DDL runs once per process: the first caller issues it under the
+# lock, later callers only check the event
+_table_ready = asyncio.Event()
+_table_lock = asyncio.Lock()
+
+# Same table as create_table.sql; its opt-in lz4 compression is not applied here
+SESSIONS_TABLE_DDL = """
+    CREATE TABLE IF NOT EXISTS sessions (
+        id TEXT PRIMARY KEY,
+        state JSONB NOT NULL,
+        updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+    )
+"""
+
+# Hot session queries. Constant text lets asyncpg's statement cache reuse
+# the prepared statement on each connection. State is bound as a dict
+# through the JSONB codec installed by init_connection, and read back as
+# JSON text so it can be sent to the client without a dict round-trip
+INSERT_SESSION_SQL = "INSERT INTO sessions (id, state) VALUES ($1, $2)"
+SELECT_SESSION_SQL = "SELECT state::text AS state FROM sessions WHERE id=$1"
+# Multi-row insert used by the insert batcher: one statement, one round-trip
+INSERT_SESSIONS_BATCH_SQL = (
+    "INSERT INTO sessions (id, state) SELECT * FROM unnest($1::text[], $2::jsonb[])"
+)
+UPDATE_SESSION_SQL = (
+    "UPDATE sessions SET state=$1, updated_at=NOW() WHERE id=$2 RETURNING id"
+)
+
+def _encode_jsonb(value):
+    # Binary JSONB wire format: version byte followed by the JSON text
+    return b"\x01" + orjson.dumps(value)
+
+def _decode_jsonb(data):
+    return orjson.loads(data[1:])
+
+async def init_connection(conn):
+    """Per-connection setup: (de)serialize JSONB with orjson in binary format"""
+    await conn.set_type_codec(
+        "jsonb",
+        encoder=_encode_jsonb,
+        decoder=_decode_jsonb,
+        schema="pg_catalog",
+        format="binary",
+    )
 
 async def ensure_table_exists(conn):
     """Ensure the sessions table exists (for Vercel where startup events don't run)"""
-    global _table_created
-    if _table_created:
+    if _table_ready.is_set():
         return
-    try:
-        # For session poolers, just use CREATE TABLE IF NOT EXISTS
-        # This is simpler and more reliable than checking information_schema
-        await conn.execute("""
-            CREATE TABLE IF NOT EXISTS sessions (
-                id TEXT PRIMARY KEY,
-                state JSONB NOT NULL,
-                updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
-            )
-        """)
-        print("Ensured sessions table exists")
-        _table_created = True
-    except Exception as e:
-        # If table creation fails, it might already exist
-        # Don't fail the whole request, but log the error
-        print(f"Warning: Could not ensure table exists: {e}")
-        import traceback
-        print(f"Traceback: {traceback.format_exc()}")
-        # Set _table_created anyway to avoid retrying on every request
+    async with _table_lock:
+        if _table_ready.is_set():
+            return
+        try:
+            # For session poolers, just use CREATE TABLE IF NOT EXISTS
+            # This is simpler and more reliable than checking information_schema
+            await conn.execute(SESSIONS_TABLE_DDL)
+            logger.debug("Ensured sessions table exists")
+        except Exception as e:
+            # If table creation fails, it might already exist
+            # Don't fail the whole request, but log the error
+            logger.warning("Could not ensure table exists: %s", e, exc_info=True)
+        # Mark it ready anyway to avoid retrying on every request
         # If table doesn't exist, the INSERT will fail with a clear error
-        _table_created = True
+        _table_ready.set()
 
 async def get_pool():
-    global _pool
-    # In serverless (Vercel), connection pooling can be problematic
-    # Create a new pool if it doesn't exist or if we're in serverless
-    if _pool is None or os.getenv("VERCEL"):
+    global _pool, _pool_loop
+    # Reuse the pool across requests, including warm serverless (Vercel)
+    # invocations. A pool is bound to the event loop that created it, so it
+    # is only rebuilt when there is none yet or the running loop changed
+    loop = asyncio.get_running_loop()
+    if _pool is None or _pool_loop is not loop:
         try:
-            if _pool and os.getenv("VERCEL"):
-                # Close old pool in serverless before creating new one
+            if _pool is not None:
+                # The old pool's loop is gone; drop its connections without awaiting it
                 try:
-                    await _pool.close()
-                except:
+                    _pool.terminate()
+                except Exception:
                     pass
-            
-            # Determine if we need SSL (Supabase and most cloud DBs require it)
-            # Check if the host is not localhost/127.0.0.1
-            needs_ssl = True  # Default to SSL for safety
-            if "localhost" in DATABASE_URL or "127.0.0.1" in DATABASE_URL:
-                needs_ssl = False
-            
-            # Check if using session pooler (usually has "pooler" in hostname or port 6543)
-            is_pooler = "pooler" in DATABASE_URL.lower() or ":6543" in DATABASE_URL
-            
-            # For Supabase, ensure SSL is enabled
-            # asyncpg accepts ssl=True/False, or we can add ?sslmode=require to the URL
-            # If connection string doesn't already have sslmode, add it for cloud DBs
-            db_url = DATABASE_URL
-            if needs_ssl and "sslmode" not in db_url:
-                separator = "&" if "?" in db_url else "?"
-                db_url = f"{db_url}{separator}sslmode=require"
-            
-            # For session poolers, use smaller pool and shorter timeout
-            # Session poolers handle connection management differently
-            pool_size = 1 if is_pooler else 2
-            timeout = 5 if is_pooler else 10
+                _pool = None
             
             # Create pool with SSL for cloud databases
             _pool = await asyncpg.create_pool(
-                db_url, 
+                **CONNECT_KWARGS,
                 min_size=1, 
-                max_size=pool_size,  # Smaller pool for session poolers
-                command_timeout=timeout,  # Shorter timeout for session poolers
-                statement_cache_size=0  # Does not prepare statement -> need better fix for continuous connection
+                max_size=POOL_MAX_SIZE,  # Smaller pool for session poolers
+                command_timeout=COMMAND_TIMEOUT,  # Shorter timeout for session poolers
+                statement_cache_size=STATEMENT_CACHE_SIZE,
+                init=init_connection
             )
+            _pool_loop = loop
+            
+            # Ensure the table once per pool rather than on every request;
+            # this also covers Vercel, where startup events don't run
+            async with _pool.acquire() as conn:
+                await ensure_table_exists(conn)
         except Exception as e:
-            print(f"Error creating database pool: {str(e)}")
+            logger.error("Error creating database pool: %s", e)
             raise
     return _pool
 
+# --- Session Cache ---
+# Optional Redis cache in front of Postgres for session reads/writes
+# Set REDIS_URL to enable it; without it every request goes to Postgres
+# Postgres stays the source of truth and is always written first. Updates
+# bump a per-session version key and delete the cached entry rather than
+# rewriting it. A read that misses notes the version before it queries
+# Postgres and refills the entry only if the version is unchanged, so
+# neither out-of-order updates nor a read racing an update can leave an
+# older state cached. Only a failed invalidation can; the TTL bounds how long
+REDIS_URL = os.getenv("REDIS_URL")
+SESSION_CACHE_TTL = 3600  # seconds; bounds staleness and keeps Redis bounded
+# Fail fast when Redis is unreachable, so requests fall back to Postgres;
+# the client's default retries with backoff would add seconds per call
+REDIS_TIMEOUT = 0.5  # seconds
+
+_redis = None
+_redis_loop = None
+# Version returned by cache_get_session when Redis could not be read
+_CACHE_UNAVAILABLE = object()
+
+def get_redis():
+    global _redis, _redis_loop
+    if not REDIS_URL:
+        return None
+    # Like the pool, the client's connections are bound to the running loop
+    loop = asyncio.get_running_loop()
+    if _redis is None or _redis_loop is not loop:
+        _redis = redis.from_url(
+            REDIS_URL,
+            socket_connect_timeout=REDIS_TIMEOUT,
+            socket_timeout=REDIS_TIMEOUT,
+            retry=Retry(NoBackoff(), 0),
+        )
+        _redis_loop = loop
+    return _redis
+
+async def cache_get_session(session_id):
+    """
+    Return (state as JSON bytes or None, version) for the session; the
+    version is passed back to cache_fill_session after a miss. A cache
+    error counts as a miss that is not refilled
+    """
+    client = get_redis()
+    if client is None:
+        return None, None
+    try:
+        return await client.mget(f"sessions:{session_id}", f"sessions:{session_id}:version")
+    except Exception as e:
+        logger.warning("Could not read session cache: %s", e)
+        return None, _CACHE_UNAVAILABLE
+
+async def cache_set_session(session_id, state):
+    """Store a new session's state in the cache; failures only log, Postgres already has it"""
+    client = get_redis()
+    if client is None:
+        return
+    try:
+        await client.set(f"sessions:{session_id}", orjson.dumps(state), ex=SESSION_CACHE_TTL)
+    except Exception as e:
+        logger.warning("Could not write session cache: %s", e)
+
+async def cache_fill_session(session_id, state, version):
+    """
+    Cache state (JSON bytes) read from Postgres after a miss, unless the
+    session was updated since cache_get_session returned version
+    """
+    client = get_redis()
+    if client is None or version is _CACHE_UNAVAILABLE:
+        return
+    version_key = f"sessions:{session_id}:version"
+    try:
+        async with client.pipeline() as pipe:
+            # WATCH makes the SET fail if an update bumps the version first
+            await pipe.watch(version_key)
+            if await pipe.get(version_key) != version:
+                return
+            pipe.multi()
+            pipe.set(f"sessions:{session_id}", state, ex=SESSION_CACHE_TTL, nx=True)
+            await pipe.execute()
+    except redis.WatchError:
+        logger.debug("Session %s changed while refilling the cache", session_id)
+    except Exception as e:
+        logger.warning("Could not write session cache: %s", e)
+
+async def cache_set_sessions(records):
+    """Store several (session_id, state) pairs in one pipelined round-trip"""
+    client = get_redis()
+    if client is None:
+        return
+    try:
+        async with client.pipeline(transaction=False) as pipe:
+            for session_id, state in records:
+                pipe.set(f"sessions:{session_id}", orjson.dumps(state), ex=SESSION_CACHE_TTL)
+            await pipe.execute()
+    except Exception as e:
+        logger.warning("Could not write session cache: %s", e)
+
+async def cache_invalidate_session(session_id):
+    """Bump the version and drop the cached state after an update; failures only log"""
+    client = get_redis()
+    if client is None:
+        return
+    version_key = f"sessions:{session_id}:version"
+    try:
+        async with client.pipeline() as pipe:
+            pipe.incr(version_key)
+            # Outlive any cache entry a racing read could still write
+            pipe.expire(version_key, SESSION_CACHE_TTL)
+            pipe.delete(f"sessions:{session_id}")
+            await pipe.execute()
+    except Exception as e:
+        logger.warning("Could not invalidate session cache: %s", e)
+
+# --- Session Insert Batching ---
+# Concurrent create_session calls are coalesced: while one batch is being
+# written, new inserts queue up and go out together as one multi-row INSERT.
+# There is no timer, so a lone insert is written immediately, and every
+# caller still waits until its own row is committed
+INSERT_BATCH_SIZE = 50
+
+_insert_queue = None
+_insert_worker = None
+
+async def insert_session(session_id, state):
+    """Queue a session insert and wait until it is committed"""
+    global _insert_queue, _insert_worker
+    loop = asyncio.get_running_loop()
+    if _insert_worker is None or _insert_worker.done() or _insert_worker.get_loop() is not loop:
+        _insert_queue = asyncio.Queue()
+        _insert_worker = loop.create_task(flush_session_inserts(_insert_queue))
+    future = loop.create_future()
+    _insert_queue.put_nowait((session_id, state, future))
+    await future
+
+async def flush_session_inserts(queue):
+    """Background worker: write queued inserts in batches and resolve their futures"""
+    batch = []
+    try:
+        while True:
+            batch = [await queue.get()]
+            while len(batch) < INSERT_BATCH_SIZE and not queue.empty():
+                batch.append(queue.get_nowait())
+            try:
+                pool = await get_pool()
+                async with pool.acquire() as conn:
+                    if len(batch) == 1:
+                        await conn.execute(INSERT_SESSION_SQL, batch[0][0], batch[0][1])
+                    else:
+                        try:
+                            await conn.execute(
+                                INSERT_SESSIONS_BATCH_SQL,
+                                [sid for sid, _, _ in batch],
+                                [state for _, state, _ in batch],
+                            )
+                        except Exception:
+                            # The batch insert is atomic; retry row by row so only the
+                            # offending caller sees the error
+                            for sid, state, future in batch:
+                                try:
+                                    await conn.execute(INSERT_SESSION_SQL, sid, state)
+                                except Exception as e:
+                                    if not future.done():
+                                        future.set_exception(e)
+            except Exception as e:
+                for _, _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_result(None)
+    except asyncio.CancelledError:
+        # Shutting down: fail the in-flight batch and everything still queued,
+        # so no create_session call is left waiting forever
+        fail_pending_inserts(queue, batch)
+        raise
+
+def fail_pending_inserts(queue, batch=()):
+    """Fail the given batch and every insert still queued"""
+    error = RuntimeError("Session insert worker stopped")
+    pending = list(batch)
+    while not queue.empty():
+        pending.append(queue.get_nowait())
+    for _, _, future in pending:
+        if not future.done():
+            future.set_exception(error)
+
+async def stop_insert_worker():
+    """Cancel the insert worker and fail every insert it had not committed"""
+    if _insert_worker is None:
+        return
+    _insert_worker.cancel()
+    await asyncio.gather(_insert_worker, return_exceptions=True)
+    # A worker cancelled before its first step never ran its own cleanup
+    fail_pending_inserts(_insert_queue)
+
+async def warm_connection(pool):
+    async with pool.acquire() as conn:
+        await conn.fetchval("SELECT 1")
+
 # Startup event - only run in non-serverless environments
 # Vercel serverless functions don't support startup events reliably
 if not os.getenv("VERCEL"):
     @app.on_event("startup")
     async def startup():
         try:
+            # Creating the pool also ensures the sessions table exists
             pool = await get_pool()
-            async with pool.acquire() as conn:
-                await conn.execute("""
-                    CREATE TABLE IF NOT EXISTS sessions (
-                        id TEXT PRIMARY KEY,
-                        state JSONB NOT NULL,
-                        updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
-                    )
-                """)
+            # Open every pool connection up front so the first requests
+            # don't pay the connect (and TLS) handshake
+            await asyncio.gather(*(warm_connection(pool) for _ in range(POOL_MAX_SIZE)))
         except Exception as e:
-            print(f"Warning: Could not create table (might already exist): {e}")
+            logger.warning("Could not create or warm up the database pool: %s", e)
 
 # Shutdown event - only in non-serverless
 if not os.getenv("VERCEL"):
     @app.on_event("shutdown")
     async def shutdown():
         global _pool
+        # Fail pending inserts before the pool closes
+        await stop_insert_worker()
         if _pool:
             await _pool.close()
             _pool = None
 
 # --- Data Models ---
-class Dish(BaseModel):
+class Record(BaseModel):
+    """Model readable by key, so calculator functions can consume it like a dict"""
+    def __getitem__(self, key):
+        return getattr(self, key)
+
+    def get(self, key, default=None):
+        return getattr(self, key, default)
+
+# Prices and amounts must be finite and bounded, so they convert to
+# integer cents; out-of-range input is a 422, not a calculation error
+MAX_AMOUNT = 1e12
+Amount = Annotated[float, Field(allow_inf_nan=False, gt=-MAX_AMOUNT, lt=MAX_AMOUNT)]
+
+class Dish(Record):
     id: str
     name: str
-    price: float
+    price: Amount
 
 class Person(BaseModel):
     id: str
@@ -165,13 +450,13 @@ class Section1Data(BaseModel):
     dishes: List[Dish]
     ratios: Dict[str, Dict[str, int]]
 
-class Payment(BaseModel):
+class Payment(Record):
     person_id: str
-    amount: float
+    amount: Amount
 
-class Cover(BaseModel):
+class Cover(Record):
     person_id: str
-    amount: float
+    amount: Amount
 
 class BillData(BaseModel):
     section1: Section1Data
@@ -181,11 +466,19 @@ class BillData(BaseModel):
 class SessionPayload(BaseModel):
     state: dict
 
+# Upper bound on sessions per bulk request, so one body can't tie up a
+# connection (and the cache pipeline) indefinitely
+BULK_MAX_SESSIONS = 500
+
 # --- Routes ---
 
 @app.get("/", response_class=HTMLResponse)
 async def read_root(request: Request):
-    return templates.TemplateResponse("index.html", {"request": request})
+    return HTMLResponse(_INDEX_BYTES)
+
+def new_session_id():
+    """128 random bits as 22 URL-safe characters (same entropy as uuid4)"""
+    return base64.urlsafe_b64encode(os.urandom(16)).rstrip(b"=").decode()
 
 @app.post("/sessions")
 async def create_session(payload: SessionPayload):
@@ -194,149 +487,202 @@ async def create_session(payload: SessionPayload):
         if not payload or not payload.state:
             raise HTTPException(status_code=400, detail="Invalid payload: state is required")
         
-        pool = await get_pool()
-        session_id = uuid.uuid4().hex
+        session_id = new_session_id()
         
-        # Check if using session pooler
-        is_pooler = "pooler" in DATABASE_URL.lower() or ":6543" in DATABASE_URL
+        # Inserts are batched with concurrent requests (auto-committed either way)
+        # The table is ensured once when the pool is created
+        await insert_session(session_id, payload.state)
+        logger.debug("Session created: %s", session_id)
         
-        # Prepare the state JSON
-        try:
-            state_json = json.dumps(payload.state)
-            print(f"Creating session {session_id} with state size: {len(state_json)} bytes")
-        except Exception as json_error:
-            print(f"Error serializing state to JSON: {json_error}")
-            raise HTTPException(status_code=400, detail=f"Invalid state data: {str(json_error)}")
+        await cache_set_session(session_id, payload.state)
+        return ORJSONResponse({"id": session_id})
+    except HTTPException:
+        raise
+    except asyncpg.DataError as json_error:
+        # The JSONB codec could not serialize the state
+        logger.warning("Error serializing state to JSON: %s", json_error)
+        raise HTTPException(status_code=400, detail=f"Invalid state data: {str(json_error)}")
+    except Exception as e:
+        error_msg = str(e)
+        logger.exception("Error creating session")
+        raise HTTPException(status_code=500, detail=f"Failed to create session: {error_msg}")
+
+@app.post("/sessions/bulk")
+async def create_sessions_bulk(
+    payloads: Annotated[List[SessionPayload], Body(max_length=BULK_MAX_SESSIONS)],
+):
+    """Create several sessions in one binary COPY; returns their ids in order"""
+    try:
+        if not payloads or any(not payload.state for payload in payloads):
+            raise HTTPException(status_code=400, detail="Invalid payload: state is required")
+        
+        records = [(new_session_id(), payload.state) for payload in payloads]
         
+        pool = await get_pool()
         async with pool.acquire() as conn:
-            # Ensure table exists first
-            await ensure_table_exists(conn)
-            
-            # For session poolers, execute directly (each execute is auto-committed)
-            # For regular connections, also execute directly (asyncpg auto-commits by default)
-            try:
-                result = await conn.execute(
-                    "INSERT INTO sessions (id, state) VALUES ($1, $2::jsonb)",
-                    session_id,
-                    state_json,
-                )
-                print(f"Session created successfully: {result}")
-            except Exception as insert_error:
-                error_msg = str(insert_error)
-                print(f"INSERT failed: {error_msg}")
-                print(f"Error type: {type(insert_error).__name__}")
-                # Check if it's a table doesn't exist error
-                if "does not exist" in error_msg.lower() or "relation" in error_msg.lower():
-                    print("Table might not exist, trying to create it again...")
-                    _table_created = False  # Reset flag to retry table creation
-                    await ensure_table_exists(conn)
-                    # Retry the insert
-                    result = await conn.execute(
-                        "INSERT INTO sessions (id, state) VALUES ($1, $2::jsonb)",
-                        session_id,
-                        state_json,
-                    )
-                    print(f"Session created after table creation: {result}")
-                else:
-                    raise
+            await conn.copy_records_to_table(
+                "sessions", records=records, columns=["id", "state"]
+            )
+        logger.debug("Created %d sessions", len(records))
         
-        return {"id": session_id}
+        await cache_set_sessions(records)
+        return ORJSONResponse({"ids": [session_id for session_id, _ in records]})
     except HTTPException:
         raise
+    except (asyncpg.DataError, orjson.JSONEncodeError) as json_error:
+        # The JSONB codec could not serialize one of the states (COPY
+        # surfaces the encoder's own error rather than a DataError)
+        logger.warning("Error serializing state to JSON: %s", json_error)
+        raise HTTPException(status_code=400, detail=f"Invalid state data: {str(json_error)}")
     except Exception as e:
         error_msg = str(e)
-        print(f"Error creating session: {error_msg}")
-        print(f"Error type: {type(e).__name__}")
-        import traceback
-        traceback_str = traceback.format_exc()
-        print(f"Traceback: {traceback_str}")
-        raise HTTPException(status_code=500, detail=f"Failed to create session: {error_msg}")
+        logger.exception("Error creating sessions")
+        raise HTTPException(status_code=500, detail=f"Failed to create sessions: {error_msg}")
+
+def session_response(session_id, state_json):
+    """Build the session JSON body around already-encoded state bytes"""
+    return Response(
+        content=b'{"id":' + orjson.dumps(session_id) + b',"state":' + state_json + b'}',
+        media_type="application/json",
+    )
 
 @app.get("/sessions/{session_id}")
 async def get_session(session_id: str):
     try:
+        # State is JSON bytes both from the cache and from Postgres, and is
+        # spliced into the response as-is instead of being parsed and re-encoded
+        cached, version = await cache_get_session(session_id)
+        if cached is not None:
+            return session_response(session_id, cached)
+        
         pool = await get_pool()
-        is_pooler = "pooler" in DATABASE_URL.lower() or ":6543" in DATABASE_URL
         
+        # Single statements auto-commit, no explicit transaction needed
         async with pool.acquire() as conn:
-            # Ensure table exists
-            await ensure_table_exists(conn)
-            # Session poolers may not support explicit transactions
-            if is_pooler:
-                row = await conn.fetchrow("SELECT state FROM sessions WHERE id=$1", session_id)
-            else:
-                async with conn.transaction():
-                    row = await conn.fetchrow("SELECT state FROM sessions WHERE id=$1", session_id)
-        if not row:
+            state = await conn.fetchval(SELECT_SESSION_SQL, session_id)
+        # state is NOT NULL, so None means there is no such session
+        if state is None:
             raise HTTPException(status_code=404, detail="Session not found")
-        # state is stored as JSONB; ensure we return a dict
-        raw_state = row["state"]
-        if isinstance(raw_state, str):
-            state = json.loads(raw_state)
-        else:
-            state = raw_state
-        return {"id": session_id, "state": state}
+        state = state.encode("utf-8")
+        await cache_fill_session(session_id, state, version)
+        return session_response(session_id, state)
     except HTTPException:
         raise
     except Exception as e:
-        print(f"Error getting session: {str(e)}")
-        print(f"Session ID: {session_id}")
+        logger.exception("Error getting session %s", session_id)
         raise HTTPException(status_code=500, detail=f"Failed to get session: {str(e)}")
 
 @app.put("/sessions/{session_id}")
 async def update_session(session_id: str, payload: SessionPayload):
     try:
         pool = await get_pool()
-        is_pooler = "pooler" in DATABASE_URL.lower() or ":6543" in DATABASE_URL
         
+        # Single statements auto-commit, no explicit transaction needed
         async with pool.acquire() as conn:
-            # Ensure table exists
-            await ensure_table_exists(conn)
-            # Session poolers may not support explicit transactions
-            if is_pooler:
-                result = await conn.execute(
-                    "UPDATE sessions SET state=$1::jsonb, updated_at=NOW() WHERE id=$2",
-                    json.dumps(payload.state),
-                    session_id,
-                )
-            else:
-                async with conn.transaction():
-                    result = await conn.execute(
-                        "UPDATE sessions SET state=$1::jsonb, updated_at=NOW() WHERE id=$2",
-                        json.dumps(payload.state),
-                        session_id,
-                    )
-        if result.endswith("UPDATE 0"):
+            updated = await conn.fetchval(
+                UPDATE_SESSION_SQL,
+                payload.state,
+                session_id,
+            )
+        # RETURNING yields no row when no session matched
+        if updated is None:
             raise HTTPException(status_code=404, detail="Session not found")
-        return {"id": session_id}
+        # Invalidate rather than SET, so out-of-order PUTs can't cache an old state
+        await cache_invalidate_session(session_id)
+        return ORJSONResponse({"id": session_id})
     except HTTPException:
         raise
+    except asyncpg.DataError as json_error:
+        # The JSONB codec could not serialize the state
+        logger.warning("Error serializing state to JSON: %s", json_error)
+        raise HTTPException(status_code=400, detail=f"Invalid state data: {str(json_error)}")
     except Exception as e:
-        print(f"Error updating session: {str(e)}")
-        print(f"Session ID: {session_id}")
-        print(f"Payload state keys: {list(payload.state.keys()) if isinstance(payload.state, dict) else 'N/A'}")
+        logger.exception("Error updating session %s", session_id)
         raise HTTPException(status_code=500, detail=f"Failed to update session: {str(e)}")
 
-@app.post("/calculate")
-async def calculate_split(data: BillData):
-    # Map IDs to Names for final output
+# --- Calculation Cache ---
+# The UI recalculates on every edit, often resending an identical bill.
+# Responses are cached in-process (LRU) by a digest of the raw request
+# body, so a repeat skips validation and calculation entirely
+CALC_CACHE_SIZE = 256
+_calc_cache = OrderedDict()
+
+def json_finite(value):
+    """Copy of value with NaN/Infinity floats, at any depth, turned into strings"""
+    if isinstance(value, float):
+        return value if math.isfinite(value) else str(value)
+    if isinstance(value, dict):
+        return {key: json_finite(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [json_finite(item) for item in value]
+    return value
+
+def body_error(err):
+    """Shape a pydantic error like FastAPI's own request body errors"""
+    err = {**err, "loc": ("body", *err["loc"])}
+    # The 422 response is plain JSON, which has no NaN/Infinity literals
+    if "input" in err:
+        err["input"] = json_finite(err["input"])
+    return err
+
+# The body is validated by hand in calculate_split, so FastAPI cannot see
+# it; document BillData (and the models it nests) in the OpenAPI schema
+BILL_DATA_SCHEMA = BillData.model_json_schema(ref_template="#/components/schemas/{model}")
+BILL_DATA_SCHEMAS = {**BILL_DATA_SCHEMA.pop("$defs", {}), "BillData": BILL_DATA_SCHEMA}
+
+_default_openapi = app.openapi
+
+def openapi():
+    if app.openapi_schema is None:
+        schema = _default_openapi()
+        schema.setdefault("components", {}).setdefault("schemas", {}).update(BILL_DATA_SCHEMAS)
+    return app.openapi_schema
+
+app.openapi = openapi
+
+@app.post("/calculate", openapi_extra={
+    "requestBody": {
+        "required": True,
+        "content": {"application/json": {"schema": {"$ref": "#/components/schemas/BillData"}}},
+    },
+})
+async def calculate_split(request: Request):
+    body = await request.body()
+    cache_key = hashlib.blake2b(body, digest_size=16).digest()
+    cached = _calc_cache.get(cache_key)
+    if cached is not None:
+        _calc_cache.move_to_end(cache_key)
+        return Response(content=cached, media_type="application/json")
+
+    # Parse and validate the raw body in one step (pydantic-core, no
+    # intermediate Python dict); errors keep FastAPI's 422 format
+    try:
+        data = BillData.model_validate_json(body)
+    except ValidationError as e:
+        raise RequestValidationError([body_error(err) for err in e.errors(include_url=False)])
+
+    # Nothing to split: with no people or no dishes nobody owes anything
+    if not data.section1.people or not data.section1.dishes:
+        return ORJSONResponse({"settlements": []})
+
+    # Map IDs to Names for final output; the keys view doubles as the
+    # ordered, de-duplicated id list without copying it
     people_names = {p.id: p.name for p in data.section1.people}
-    people_ids = list(people_names.keys())
+    people_ids = people_names.keys()
 
-    # Convert Pydantic models to dicts for calculator functions
-    dishes = [{"id": d.id, "price": d.price} for d in data.section1.dishes]
-    covers = [{"person_id": c.person_id, "amount": c.amount} for c in data.covers]
-    payments = [{"person_id": p.person_id, "amount": p.amount} for p in data.payments]
+    # Records are passed straight through; calculator reads them by key
+    dishes = data.section1.dishes
+    covers = data.covers
+    payments = data.payments
 
-    # Step 1: Calculate consumption
-    raw_consumption, total_bill_price = calculate_consumption(
-        people_ids, dishes, data.section1.ratios
+    # Steps 1-2: Calculate consumption and final costs with covers
+    final_costs, total_bill_price = compute_costs(
+        people_ids, dishes, data.section1.ratios, covers
     )
 
-    # Step 2: Calculate final costs with covers
-    final_costs = calculate_final_costs(
-        people_ids, raw_consumption, total_bill_price, covers
-    )
+    # A free bill zeroes every cost, so payments only leave creditors
+    if total_bill_price <= 0:
+        return ORJSONResponse({"settlements": []})
 
     # Step 3: Calculate balances
     balances = calculate_balances(people_ids, final_costs, payments)
@@ -344,7 +690,12 @@ async def calculate_split(data: BillData):
     # Step 4: Calculate settlements
     settlements = calculate_settlements(balances, people_names)
 
-    return {"settlements": settlements}
+    # Return the response directly so FastAPI skips jsonable_encoder
+    content = orjson.dumps({"settlements": settlements})
+    _calc_cache[cache_key] = content
+    if len(_calc_cache) > CALC_CACHE_SIZE:
+        _calc_cache.popitem(last=False)
+    return Response(content=content, media_type="application/json")
 
 # Export handler for Vercel
 # Vercel's @vercel/python runtime automatically detects FastAPI apps
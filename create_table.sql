@@ -5,3 +5,8 @@ CREATE TABLE IF NOT EXISTS sessions (
     updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
 );
 
+-- Optional, off by default (PostgreSQL 14+ built with lz4, e.g. Supabase):
+-- compress large session states with lz4 instead of pglz. Cheaper to
+-- (de)compress, and it applies to rows written after the change.
+-- Uncomment to opt in
+-- ALTER TABLE sessions ALTER COLUMN state SET COMPRESSION lz4;
@@ -0,0 +1,363 @@
+"""
+API tests that need no database: requests either never reach it or get
+a fake pool in its place.
+"""
+
+import asyncio
+import contextlib
+import hashlib
+import inspect
+import os
+
+import asyncpg
+import fakeredis
+import pytest
+
+# api.index requires DATABASE_URL at import; nothing here connects to it
+os.environ.setdefault("DATABASE_URL", "postgres://test@localhost/test")
+
+from fastapi.testclient import TestClient
+
+import api.index
+from api.index import BULK_MAX_SESSIONS, app
+
+
+@pytest.fixture(scope="module")
+def client():
+    # Not used as a context manager, so the startup hook (pool) never runs
+    return TestClient(app)
+
+
+def bill_body(price="40.0"):
+    """Raw JSON for a two-person bill, with the dish price spliced in as-is."""
+    return (
+        '{"section1": {"people": [{"id": "p1", "name": "Alice"}, {"id": "p2", "name": "Bob"}],'
+        ' "dishes": [{"id": "d1", "name": "Pho", "price": ' + price + '}],'
+        ' "ratios": {"p1": {"d1": 1}, "p2": {"d1": 1}}},'
+        ' "payments": [{"person_id": "p1", "amount": 40.0}], "covers": []}'
+    )
+
+
+@pytest.fixture
+def calc_cache():
+    """The /calculate response cache, emptied before and after the test."""
+    api.index._calc_cache.clear()
+    yield api.index._calc_cache
+    api.index._calc_cache.clear()
+
+
+class FakeConnection:
+    """Stands in for an asyncpg connection; plug in behaviour per test."""
+    
+    def __init__(self):
+        self.calls = []
+        self.on_execute = None
+        self.on_fetchval = None
+    
+    async def execute(self, *args):
+        self.calls.append(args)
+        if self.on_execute:
+            return await maybe_await(self.on_execute(*args))
+    
+    async def fetchval(self, *args):
+        self.calls.append(args)
+        if self.on_fetchval:
+            return await maybe_await(self.on_fetchval(*args))
+    
+    async def copy_records_to_table(self, table, records, columns):
+        self.calls.append((table, records, columns))
+
+
+async def maybe_await(result):
+    return await result if inspect.isawaitable(result) else result
+
+
+class FakePool:
+    def __init__(self, conn):
+        self.conn = conn
+    
+    @contextlib.asynccontextmanager
+    async def acquire(self):
+        yield self.conn
+
+
+@pytest.fixture
+def fake_conn(monkeypatch):
+    """A FakeConnection that get_pool hands out instead of a database."""
+    conn = FakeConnection()
+    
+    async def get_pool():
+        return FakePool(conn)
+    
+    monkeypatch.setattr(api.index, "get_pool", get_pool)
+    return conn
+
+
+def cache_key(body):
+    return hashlib.blake2b(body.encode(), digest_size=16).digest()
+
+
+def test_calculate_settles_bill(client):
+    response = client.post("/calculate", content=bill_body())
+    
+    assert response.status_code == 200
+    assert response.json() == {"settlements": [
+        {"debtor_id": "p2", "debtor_name": "Bob",
+         "creditor_id": "p1", "creditor_name": "Alice", "amount": 20.0}
+    ]}
+
+
+@pytest.mark.parametrize("price", ["Infinity", "-Infinity", "NaN", "1e308"])
+def test_calculate_rejects_non_finite_price(client, price):
+    """Edge case: non-finite or out-of-range prices are a 422, not a 500."""
+    response = client.post("/calculate", content=bill_body(price))
+    
+    assert response.status_code == 422
+    assert response.json()["detail"][0]["loc"] == ["body", "section1", "dishes", 0, "price"]
+
+
+@pytest.mark.parametrize("body,loc", [
+    # The error input is the dish, which holds the Infinity
+    ('{"section1": {"people": [], "dishes": [{"id": "d", "price": Infinity}], "ratios": {}},'
+     ' "payments": [], "covers": []}',
+     ["body", "section1", "dishes", 0, "name"]),
+    # The error input is the whole list
+    ("[1, NaN]", ["body"]),
+])
+def test_calculate_rejects_nested_non_finite_input(client, body, loc):
+    """Edge case: NaN/Infinity nested in an error's input still give a 422."""
+    response = client.post("/calculate", content=body)
+    
+    assert response.status_code == 422
+    assert response.json()["detail"][0]["loc"] == loc
+
+
+def test_calculate_missing_field(client):
+    """Validation errors keep FastAPI's body error format."""
+    response = client.post("/calculate", json={"section1": {"people": [], "dishes": [], "ratios": {}}})
+    
+    assert response.status_code == 422
+    assert response.json()["detail"] == [
+        {"type": "missing", "loc": ["body", "payments"], "msg": "Field required",
+         "input": {"section1": {"people": [], "dishes": [], "ratios": {}}}},
+        {"type": "missing", "loc": ["body", "covers"], "msg": "Field required",
+         "input": {"section1": {"people": [], "dishes": [], "ratios": {}}}},
+    ]
+
+
+def test_calculate_invalid_json(client):
+    response = client.post("/calculate", content="{not json")
+    
+    assert response.status_code == 422
+    error, = response.json()["detail"]
+    assert error["type"] == "json_invalid"
+    assert error["loc"] == ["body"]
+    assert "url" not in error
+
+
+def test_calculate_cache_hit_skips_validation(client, calc_cache, monkeypatch):
+    first = client.post("/calculate", content=bill_body())
+    
+    def fail(*args, **kwargs):
+        raise AssertionError("cached body was validated again")
+    
+    monkeypatch.setattr(api.index.BillData, "model_validate_json", fail)
+    second = client.post("/calculate", content=bill_body())
+    
+    assert second.status_code == 200
+    assert second.content == first.content
+
+
+def test_calculate_cache_evicts_least_recently_used(client, calc_cache, monkeypatch):
+    monkeypatch.setattr(api.index, "CALC_CACHE_SIZE", 2)
+    a, b, c = bill_body("40.0"), bill_body("40.5"), bill_body("41.0")
+    
+    client.post("/calculate", content=a)
+    client.post("/calculate", content=b)
+    client.post("/calculate", content=a)  # hit: a becomes most recent
+    client.post("/calculate", content=c)
+    
+    assert list(calc_cache) == [cache_key(a), cache_key(c)]
+
+
+@pytest.mark.parametrize("body", [
+    # Early return: no dishes
+    '{"section1": {"people": [{"id": "p1", "name": "Alice"}], "dishes": [], "ratios": {}},'
+    ' "payments": [], "covers": []}',
+    # Early return: free bill
+    bill_body("0"),
+    # 422
+    bill_body("NaN"),
+    "{not json",
+])
+def test_calculate_does_not_cache_early_returns_or_errors(client, calc_cache, body):
+    client.post("/calculate", content=body)
+    
+    assert len(calc_cache) == 0
+
+
+def test_calculate_documents_request_body(client):
+    schema = client.get("/openapi.json").json()
+    
+    request_body = schema["paths"]["/calculate"]["post"]["requestBody"]
+    assert request_body["content"]["application/json"]["schema"] == {
+        "$ref": "#/components/schemas/BillData"
+    }
+    # Nested models resolve within the document
+    components = schema["components"]["schemas"]
+    assert {"BillData", "Section1Data", "Dish", "Person", "Payment", "Cover"} <= components.keys()
+
+
+def test_bulk_sessions_rejects_oversized_list(client):
+    """Edge case: the list cap is enforced before any database work."""
+    payloads = [{"state": {"n": 1}}] * (BULK_MAX_SESSIONS + 1)
+    response = client.post("/sessions/bulk", json=payloads)
+    
+    assert response.status_code == 422
+    error, = response.json()["detail"]
+    assert error["type"] == "too_long"
+    assert error["loc"] == ["body"]
+
+
+def test_update_session_rejects_unencodable_state(client, fake_conn):
+    """Edge case: state the JSONB codec can't encode is a 400, as on create."""
+    def fetchval(*args):
+        raise asyncpg.DataError("Integer exceeds 64-bit range")
+    
+    fake_conn.on_fetchval = fetchval
+    response = client.put("/sessions/abc", json={"state": {"big": 10**30}})
+    
+    assert response.status_code == 400
+    assert response.json()["detail"].startswith("Invalid state data")
+
+
+def run_inserts(*session_ids):
+    """Run concurrent insert_session calls; exceptions are returned, not raised."""
+    async def main():
+        return await asyncio.gather(
+            *(api.index.insert_session(sid, {"n": sid}) for sid in session_ids),
+            return_exceptions=True,
+        )
+    return asyncio.run(main())
+
+
+def test_concurrent_inserts_share_one_statement(fake_conn):
+    results = run_inserts("a", "b", "c")
+    
+    assert results == [None, None, None]
+    assert fake_conn.calls == [(
+        api.index.INSERT_SESSIONS_BATCH_SQL,
+        ["a", "b", "c"],
+        [{"n": "a"}, {"n": "b"}, {"n": "c"}],
+    )]
+
+
+def test_failed_batch_only_fails_the_bad_row(fake_conn):
+    def execute(sql, *args):
+        if sql == api.index.INSERT_SESSIONS_BATCH_SQL or args[0] == "bad":
+            raise asyncpg.DataError("bad state")
+    
+    fake_conn.on_execute = execute
+    ok, bad, also_ok = run_inserts("ok", "bad", "also_ok")
+    
+    assert ok is None and also_ok is None
+    assert isinstance(bad, asyncpg.DataError)
+    # The batch, then one retry per row
+    assert [args[1] for args in fake_conn.calls[1:]] == ["ok", "bad", "also_ok"]
+
+
+@pytest.mark.parametrize("steps", [
+    pytest.param(0, id="before_worker_starts"),
+    pytest.param(1, id="batch_in_flight"),
+])
+def test_stopped_worker_fails_pending_inserts(monkeypatch, steps):
+    async def get_pool():
+        await asyncio.Event().wait()  # never connects
+    
+    monkeypatch.setattr(api.index, "get_pool", get_pool)
+    
+    async def main():
+        inserts = [asyncio.create_task(api.index.insert_session("a", {}))]
+        for _ in range(steps):
+            await asyncio.sleep(0)
+        # Queued behind an in-flight batch, or before the worker ever ran
+        inserts += [asyncio.create_task(api.index.insert_session(sid, {})) for sid in "bc"]
+        await asyncio.sleep(0)
+        await api.index.stop_insert_worker()
+        return await asyncio.wait_for(asyncio.gather(*inserts, return_exceptions=True), 1)
+    
+    results = asyncio.run(main())
+    
+    assert len(results) == 3
+    assert all(isinstance(result, RuntimeError) for result in results)
+
+
+@pytest.fixture
+def fake_redis(monkeypatch):
+    """Sync view of an in-memory Redis that the session cache helpers use."""
+    server = fakeredis.FakeServer()
+    monkeypatch.setattr(
+        api.index, "get_redis", lambda: fakeredis.FakeAsyncRedis(server=server)
+    )
+    return fakeredis.FakeRedis(server=server)
+
+
+def test_get_session_miss_fills_cache(client, fake_conn, fake_redis):
+    fake_conn.on_fetchval = lambda sql, session_id: '{"a": 1}'
+    
+    first = client.get("/sessions/abc")
+    second = client.get("/sessions/abc")
+    
+    assert first.content == second.content == b'{"id":"abc","state":{"a": 1}}'
+    assert len(fake_conn.calls) == 1  # the second read was served by Redis
+    assert fake_redis.get("sessions:abc") == b'{"a": 1}'
+    assert 0 < fake_redis.ttl("sessions:abc") <= api.index.SESSION_CACHE_TTL
+
+
+def test_update_session_invalidates_cache(client, fake_conn, fake_redis):
+    fake_redis.set("sessions:abc", b'{"old": true}')
+    fake_conn.on_fetchval = lambda sql, *args: "abc"
+    
+    response = client.put("/sessions/abc", json={"state": {"new": True}})
+    
+    assert response.status_code == 200
+    assert fake_redis.get("sessions:abc") is None
+    assert fake_redis.get("sessions:abc:version") == b"1"
+
+
+def test_get_session_miss_racing_update_is_not_cached(client, fake_conn, fake_redis):
+    """A GET that read the row before a PUT committed doesn't re-cache it."""
+    async def select_then_update(sql, session_id):
+        # The PUT lands between this read and the cache refill
+        await api.index.cache_invalidate_session(session_id)
+        return '{"old": true}'
+    
+    fake_conn.on_fetchval = select_then_update
+    response = client.get("/sessions/abc")
+    
+    assert response.json() == {"id": "abc", "state": {"old": True}}
+    assert fake_redis.get("sessions:abc") is None
+
+
+def test_session_routes_fall_back_on_redis_errors(client, fake_conn, monkeypatch, caplog):
+    # The app's own client, pointed where nothing listens
+    monkeypatch.setattr(api.index, "REDIS_URL", "redis://localhost:1")
+    monkeypatch.setattr(api.index, "_redis", None)
+    fake_conn.on_fetchval = lambda sql, *args: '{"a": 1}' if sql == api.index.SELECT_SESSION_SQL else "abc"
+    
+    assert client.get("/sessions/abc").json() == {"id": "abc", "state": {"a": 1}}
+    assert client.put("/sessions/abc", json={"state": {"a": 2}}).status_code == 200
+    assert client.post("/sessions/bulk", json=[{"state": {"n": 1}}]).status_code == 200
+    
+    assert [record.message.split(":")[0] for record in caplog.records] == [
+        "Could not read session cache",
+        "Could not invalidate session cache",
+        "Could not write session cache",
+    ]
+
+
+def test_bulk_sessions_fill_cache(client, fake_conn, fake_redis):
+    response = client.post("/sessions/bulk", json=[{"state": {"n": 1}}, {"state": {"n": 2}}])
+    
+    ids = response.json()["ids"]
+    assert fake_redis.mget([f"sessions:{sid}" for sid in ids]) == [b'{"n":1}', b'{"n":2}']